@@ -13,9 +13,18 @@ import os
 import sys
 import time
 import shutil
+import errno
 import json
+import threading
+import functools
+import tempfile
+from collections import defaultdict, OrderedDict
 import requests
-from datetime import datetime, timedelta
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 import signal
 import argparse
 import logging
@@ -24,7 +33,8 @@ import configparser
 
 # 设置日志
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
+# 默认INFO级别，可通过配置文件中的log_level调整
+logger.setLevel(logging.INFO)
 
 # 创建控制台处理器
 console_handler = logging.StreamHandler(sys.stdout)
@@ -50,8 +60,17 @@ file_handler.setFormatter(file_formatter)
 logger.addHandler(console_handler)
 logger.addHandler(file_handler)
 
-# 导入pytz用于时区处理
-import pytz
+# paho-mqtt为可选依赖，仅在配置了MQTT时用于订阅导出完成事件
+try:
+    import paho.mqtt.client as mqtt
+except ImportError:
+    mqtt = None
+
+# orjson为可选依赖，安装后用于加速导出列表等JSON数据的解析
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # 全局配置变量（初始值为空字符串）
 FRIGATE_API_URL = ""
@@ -60,7 +79,59 @@ DEST_PATH = ""
 EXPORT_RETENTION_DAYS = 30
 EXPORT_DAYS_AGO = 1
 TIMEZONE = "Asia/Shanghai"
-TIMEZONE_OBJ = pytz.timezone(TIMEZONE)  # 初始化为默认时区
+# 初始化为默认时区，系统缺少时区数据库（且未安装tzdata）时退回UTC，由load_config重新设置
+try:
+    TIMEZONE_OBJ = ZoneInfo(TIMEZONE)
+except (ZoneInfoNotFoundError, ValueError):
+    TIMEZONE_OBJ = timezone.utc
+
+# 源目录和目标目录是否位于同一文件系统，启动时检测一次
+SAME_FILESYSTEM = False
+
+# 跨文件系统复制文件时每次内核复制的块大小（8 MiB）
+COPY_CHUNK_SIZE = 8 * 1024 * 1024
+
+# MQTT配置（可选，未配置主机时使用轮询方式检查导出状态）
+MQTT_HOST = ""
+MQTT_PORT = 1883
+MQTT_USERNAME = ""
+MQTT_PASSWORD = ""
+MQTT_TOPIC = "frigate/exports/#"
+
+# 同时发起导出请求的最大并发数
+EXPORT_MAX_WORKERS = 8
+
+# 同时移动导出文件的最大并发数
+MOVE_MAX_WORKERS = 4
+
+# 轮询导出状态的间隔（秒）：状态无变化时按倍数退避，直到上限；状态变化时重置
+POLL_INTERVAL_MIN = 5
+POLL_INTERVAL_MAX = 60
+POLL_BACKOFF_FACTOR = 1.5
+
+# 文件大小、任务开始时间等跟踪记录的最大条目数，超出时淘汰最早的记录
+TRACKING_MAX_ENTRIES = 1024
+
+# 文件大小显示单位，每级相差1024倍
+FILE_SIZE_UNITS = ('B', 'KB', 'MB', 'GB', 'TB')
+
+# 摄像头列表缓存文件，按API地址保存ETag和摄像头列表，供多次运行之间复用
+CAMERAS_CACHE_FILE = os.path.join(tempfile.gettempdir(), 'frigate-cameras.json')
+
+# HTTP请求超时时间（连接超时, 读取超时），避免请求卡住导致轮询和退出无法响应
+HTTP_TIMEOUT = (3.05, 10)
+
+# 共享的HTTP会话，复用与Frigate API之间的连接，避免每次请求重新建立TCP连接
+http_session = requests.Session()
+# 请求压缩传输，减小 /api/exports 等JSON响应的传输量
+http_session.headers.update({'Accept-Encoding': 'gzip'})
+# 连接失败或网关错误时自动重试，重试耗尽后返回最后一次的响应由调用方处理
+# 发起导出的POST不是幂等请求（网关超时时Frigate可能已开始导出），只在连接建立失败时重试
+http_retry = Retry(total=3, backoff_factor=0.5, status_forcelist=[502, 503, 504],
+                   allowed_methods=['GET', 'DELETE'], raise_on_status=False)
+http_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=10, max_retries=http_retry)
+http_session.mount('http://', http_adapter)
+http_session.mount('https://', http_adapter)
 
 def load_config(config_file='config.ini'):
     """
@@ -70,6 +141,7 @@ def load_config(config_file='config.ini'):
         config_file: 配置文件路径
     """
     global FRIGATE_API_URL, SOURCE_PATH, DEST_PATH, EXPORT_RETENTION_DAYS, EXPORT_DAYS_AGO, TIMEZONE, TIMEZONE_OBJ
+    global MQTT_HOST, MQTT_PORT, MQTT_USERNAME, MQTT_PASSWORD, MQTT_TOPIC
 
     config = configparser.ConfigParser()
     if not config.read(config_file, encoding='utf-8'):
@@ -87,14 +159,29 @@ def load_config(config_file='config.ini'):
         EXPORT_RETENTION_DAYS = config.getint('frigate', 'export_retention_days')
         EXPORT_DAYS_AGO = config.getint('frigate', 'export_days_ago', fallback=1)
         TIMEZONE = config.get('frigate', 'timezone', fallback='Asia/Shanghai')
+        log_level = config.get('frigate', 'log_level', fallback='INFO').upper()
+
+        # 设置日志级别
+        if log_level in ('DEBUG', 'INFO', 'WARNING', 'ERROR'):
+            logger.setLevel(getattr(logging, log_level))
+        else:
+            logger.warning(f"未知的日志级别: {log_level}, 使用默认级别 INFO")
 
         # 设置时区
         try:
-            TIMEZONE_OBJ = pytz.timezone(TIMEZONE)
+            TIMEZONE_OBJ = ZoneInfo(TIMEZONE)
             logger.info(f"已设置时区为: {TIMEZONE}")
-        except pytz.exceptions.UnknownTimeZoneError:
+        except (ZoneInfoNotFoundError, ValueError):
             logger.warning(f"未知的时区: {TIMEZONE}, 使用默认时区 UTC")
-            TIMEZONE_OBJ = pytz.UTC
+            TIMEZONE_OBJ = timezone.utc
+
+        # 读取可选的MQTT配置
+        if 'mqtt' in config:
+            MQTT_HOST = config.get('mqtt', 'host', fallback='')
+            MQTT_PORT = config.getint('mqtt', 'port', fallback=1883)
+            MQTT_USERNAME = config.get('mqtt', 'username', fallback='')
+            MQTT_PASSWORD = config.get('mqtt', 'password', fallback='')
+            MQTT_TOPIC = config.get('mqtt', 'topic', fallback='frigate/exports/#')
 
         logger.info(f"已从配置文件 {config_file} 加载配置")
     except Exception as e:
@@ -140,6 +227,12 @@ def main():
     logger.info(f"Frigate API地址: {FRIGATE_API_URL}")
     logger.info(f"导出文件保存路径: {DEST_PATH}")
 
+    # 检测源目录和目标目录是否位于同一文件系统，以决定移动文件的方式
+    detect_same_filesystem()
+
+    # 在发起导出之前连接MQTT，避免错过导出完成事件
+    start_mqtt_listener()
+
     # 获取摄像头列表
     if args.cameras is None:
         cameras = get_cameras()
@@ -182,14 +275,14 @@ def main():
                 
                 # 2. 等待当前时间段导出完成
                 logger.info(f"等待时间段 {start_hour:02d}:00-{end_hour:02d}:00 的导出完成...")
-                check_export_status(exported_camera_names, start_timestamps, date=args.date)
+                _, exports = check_export_status(exported_camera_names, start_timestamps, date=args.date)
                 
                 if should_exit:
                     return
                 
                 # 3. 移动当前时间段的文件
                 logger.info(f"检查并移动时间段 {start_hour:02d}:00-{end_hour:02d}:00 的导出文件...")
-                check_and_move_exported_files(exported_camera_names, start_timestamps, date=args.date)
+                check_and_move_exported_files(exported_camera_names, start_timestamps, date=args.date, prefetched_exports=exports)
                 
                 if should_exit:
                     return
@@ -222,17 +315,18 @@ def main():
     if should_exit:
         return
     
-    # 步骤2: 等待导出完成
+    # 步骤2: 等待导出完成，全部完成时复用最后一次获取的导出列表
+    exports = None
     if exported_cameras:
         logger.info("等待导出完成...")
-        check_export_status(exported_camera_names, start_timestamps, date=args.date)
+        _, exports = check_export_status(exported_camera_names, start_timestamps, date=args.date)
     
     if should_exit:
         return
     
     # 步骤3: 检查并移动已完成的导出文件
     logger.info("检查并移动导出文件...")
-    check_and_move_exported_files(exported_camera_names, start_timestamps, date=args.date)
+    check_and_move_exported_files(exported_camera_names, start_timestamps, date=args.date, prefetched_exports=exports)
     
     if should_exit:
         return
@@ -247,7 +341,14 @@ def main():
 should_exit = False
 
 # 存储任务开始时间
-export_start_times = {}
+export_start_times = OrderedDict()
+
+# MQTT客户端
+mqtt_client = None
+# 已成功连接MQTT代理并订阅主题（代理确认连接后才设置，断开时清除）
+mqtt_connected = threading.Event()
+# 收到导出完成消息时设置，用于提前唤醒轮询
+mqtt_export_event = threading.Event()
 
 def signal_handler(sig, frame):
     """处理中断信号"""
@@ -263,18 +364,236 @@ signal.signal(signal.SIGTERM, signal_handler)
 def get_cameras():
     """
     获取所有摄像头列表
+    
+    摄像头列表在一次运行中不会变化，成功获取后在进程内缓存
     """
     try:
-        response = requests.get(f"{FRIGATE_API_URL}/api/config")
-        response.raise_for_status()
-        config = response.json()
-        cameras = list(config.get('cameras', {}).keys())
-        return cameras
+        return list(_fetch_cameras(FRIGATE_API_URL))
     except Exception as e:
         logger.error(f"无法从配置获取摄像头列表: {e}")
         # 返回示例摄像头列表
         return ["tplink_ipc44aw"]
 
+@functools.lru_cache(maxsize=1)
+def _fetch_cameras(api_url):
+    """
+    从Frigate配置中获取摄像头名称，请求失败时抛出异常（异常不会被缓存）
+    
+    请求时携带上次保存的ETag，配置未变化时服务端返回304，直接使用缓存文件中的摄像头列表
+    
+    Args:
+        api_url: Frigate API地址
+        
+    Returns:
+        tuple: 摄像头名称
+    """
+    cache = _load_cameras_cache()
+    cached = cache.get(api_url)
+    # 缓存条目格式不正确时视为没有缓存，正常获取配置
+    if not (isinstance(cached, dict) and isinstance(cached.get('cameras'), list)):
+        cached = None
+    headers = {}
+    if cached and cached.get('etag'):
+        headers['If-None-Match'] = cached['etag']
+    
+    response = http_session.get(f"{api_url}/api/config", headers=headers, timeout=HTTP_TIMEOUT)
+    if response.status_code == 304 and cached:
+        logger.debug("Frigate配置未变化，使用缓存的摄像头列表")
+        return tuple(cached.get('cameras', []))
+    
+    response.raise_for_status()
+    config = loads_json(response.content)
+    cameras = tuple(config.get('cameras', {}).keys())
+    
+    etag = response.headers.get('ETag')
+    if etag:
+        cache[api_url] = {'etag': etag, 'cameras': list(cameras)}
+        _save_cameras_cache(cache)
+    return cameras
+
+def _load_cameras_cache():
+    """
+    读取摄像头列表缓存文件，文件不存在、无法解析或不属于当前用户时返回空字典
+    
+    缓存文件位于共享的临时目录，不跟随符号链接，并忽略其他用户创建的文件
+    """
+    try:
+        fd = os.open(CAMERAS_CACHE_FILE, os.O_RDONLY | getattr(os, 'O_NOFOLLOW', 0))
+        with os.fdopen(fd, 'rb') as f:
+            if hasattr(os, 'getuid') and os.fstat(f.fileno()).st_uid != os.getuid():
+                logger.debug("忽略不属于当前用户的摄像头列表缓存: %s", CAMERAS_CACHE_FILE)
+                return {}
+            cache = loads_json(f.read())
+        return cache if isinstance(cache, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+def _save_cameras_cache(cache):
+    """
+    写入摄像头列表缓存文件，先写临时文件再替换，避免并发运行时读到不完整的内容
+    
+    临时文件由mkstemp以独占方式创建（权限0600），不会被预先放置的符号链接劫持
+    """
+    tmp_file = None
+    try:
+        fd, tmp_file = tempfile.mkstemp(prefix='frigate-cameras.', suffix='.tmp',
+                                        dir=os.path.dirname(CAMERAS_CACHE_FILE))
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, ensure_ascii=False)
+        os.replace(tmp_file, CAMERAS_CACHE_FILE)
+    except OSError as e:
+        logger.debug("无法写入摄像头列表缓存 %s: %s", CAMERAS_CACHE_FILE, e)
+        if tmp_file:
+            try:
+                os.unlink(tmp_file)
+            except OSError:
+                pass
+
+def on_mqtt_connect(client, userdata, flags, reason_code, *args):
+    """
+    连接（或重连）MQTT代理后检查代理的应答，连接成功时订阅导出事件主题
+    
+    paho-mqtt 1.x 传入整数rc（0表示成功），2.x 传入ReasonCode对象
+    """
+    if hasattr(reason_code, 'is_failure'):
+        failed = reason_code.is_failure
+    else:
+        failed = reason_code != 0
+    
+    if failed:
+        logger.error(f"MQTT代理 {MQTT_HOST}:{MQTT_PORT} 拒绝连接: {reason_code}，将使用轮询方式检查导出状态")
+        mqtt_connected.clear()
+        # 停止自动重连，避免反复使用被拒绝的凭据
+        client.disconnect()
+        return
+    
+    client.subscribe(MQTT_TOPIC)
+    mqtt_connected.set()
+    logger.info(f"已连接MQTT代理 {MQTT_HOST}:{MQTT_PORT}，已订阅主题: {MQTT_TOPIC}")
+
+def on_mqtt_disconnect(client, userdata, *args):
+    """与MQTT代理断开连接后改为轮询，重连成功时由on_mqtt_connect恢复"""
+    if mqtt_connected.is_set():
+        logger.warning("与MQTT代理的连接已断开")
+    mqtt_connected.clear()
+
+def on_mqtt_message(client, userdata, msg):
+    """
+    处理导出事件消息，收到已完成的导出任务时唤醒轮询立即检查
+    
+    消息内容可以是单个导出任务对象，也可以是导出任务列表
+    """
+    try:
+        payload = loads_json(msg.payload)
+    except ValueError:
+        logger.debug("忽略无法解析的MQTT消息: %s", msg.topic)
+        return
+    
+    exports = payload if isinstance(payload, list) else [payload]
+    if any(isinstance(e, dict) and not e.get("in_progress", True) for e in exports):
+        mqtt_export_event.set()
+
+def start_mqtt_listener():
+    """
+    连接MQTT代理并在后台线程中接收导出事件
+    
+    Returns:
+        bool: 是否成功启动MQTT监听
+    """
+    global mqtt_client
+    
+    if not MQTT_HOST:
+        return False
+    if mqtt is None:
+        logger.warning("已配置MQTT但未安装paho-mqtt，将使用轮询方式检查导出状态")
+        return False
+    
+    try:
+        # paho-mqtt 2.x 需要显式指定回调API版本
+        if hasattr(mqtt, 'CallbackAPIVersion'):
+            client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        else:
+            client = mqtt.Client()
+        if MQTT_USERNAME:
+            client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD or None)
+        client.on_connect = on_mqtt_connect
+        client.on_disconnect = on_mqtt_disconnect
+        client.on_message = on_mqtt_message
+        client.connect(MQTT_HOST, MQTT_PORT)
+        client.loop_start()
+        mqtt_client = client
+        # 代理的应答在后台线程中由on_mqtt_connect处理，确认成功前不会使用MQTT
+        logger.info(f"正在连接MQTT代理: {MQTT_HOST}:{MQTT_PORT}")
+        return True
+    except Exception as e:
+        logger.error(f"连接MQTT代理 {MQTT_HOST}:{MQTT_PORT} 失败，将使用轮询方式检查导出状态: {e}")
+        return False
+
+def stop_mqtt_listener():
+    """断开MQTT连接并停止后台线程"""
+    global mqtt_client
+    
+    if mqtt_client is None:
+        return
+    mqtt_connected.clear()
+    try:
+        mqtt_client.disconnect()
+        mqtt_client.loop_stop()
+    except Exception as e:
+        logger.debug("关闭MQTT连接时出错: %s", e)
+    mqtt_client = None
+
+def wait_for_next_poll(timeout):
+    """
+    等待下一次轮询
+    
+    已连接MQTT时收到导出完成消息会提前返回，MQTT只用于缩短等待，不替代轮询
+    
+    Args:
+        timeout: 最长等待时间（秒）
+    """
+    if mqtt_connected.is_set():
+        mqtt_export_event.wait(timeout=timeout)
+    else:
+        time.sleep(timeout)
+
+def request_export(camera, start_timestamp, end_timestamp):
+    """
+    向Frigate发起单个摄像头的录像导出请求
+    
+    Args:
+        camera: 摄像头名称
+        start_timestamp: 导出开始时间戳
+        end_timestamp: 导出结束时间戳
+        
+    Returns:
+        bool: 是否成功发起导出请求
+    """
+    if should_exit:
+        return False
+        
+    try:
+        # 发起导出请求
+        export_data = {
+            "playback": "realtime",
+            "source": "recordings"
+        }
+        
+        # 根据文档，应该是POST请求到这个端点
+        export_url = f"{FRIGATE_API_URL}/api/export/{camera}/start/{start_timestamp}/end/{end_timestamp}"
+        logger.info(f"正在导出摄像头 {camera} 的录像..., export_url: {export_url}")
+        
+        response = http_session.post(export_url, json=export_data, timeout=HTTP_TIMEOUT)
+        if response.status_code in [200, 201]:
+            logger.info(f"已成功发起摄像头 {camera} 的录像导出请求")
+            return True
+        
+        logger.error(f"导出摄像头 {camera} 录像失败，状态码: {response.status_code}, 响应: {response.text}")
+    except Exception as e:
+        logger.error(f"导出摄像头 {camera} 录像时出错: {e}")
+    
+    return False
+
 def export_previous_day_recordings(cameras=None, date=None, time_range=None):
     """
     导出指定日期和时间范围的所有录像
@@ -291,7 +610,7 @@ def export_previous_day_recordings(cameras=None, date=None, time_range=None):
     if date:
         try:
             target_date = datetime.strptime(date, '%Y-%m-%d')
-            target_date = TIMEZONE_OBJ.localize(target_date)
+            target_date = target_date.replace(tzinfo=TIMEZONE_OBJ)
         except ValueError:
             logger.error(f"日期格式错误: {date}，应为 YYYY-MM-DD 格式")
             return []
@@ -310,12 +629,12 @@ def export_previous_day_recordings(cameras=None, date=None, time_range=None):
         start_hour, end_hour = 0, 24
     
     # 计算开始和结束时间戳
-    start_of_target = TIMEZONE_OBJ.localize(datetime(target_date.year, target_date.month, target_date.day, start_hour, 0, 0))
+    start_of_target = datetime(target_date.year, target_date.month, target_date.day, start_hour, 0, 0, tzinfo=TIMEZONE_OBJ)
     if end_hour == 24:
         # 24点表示下一天的0点
-        end_of_target = TIMEZONE_OBJ.localize(datetime(target_date.year, target_date.month, target_date.day, 0, 0, 0)) + timedelta(days=1)
+        end_of_target = datetime(target_date.year, target_date.month, target_date.day, 0, 0, 0, tzinfo=TIMEZONE_OBJ) + timedelta(days=1)
     else:
-        end_of_target = TIMEZONE_OBJ.localize(datetime(target_date.year, target_date.month, target_date.day, end_hour, 0, 0))
+        end_of_target = datetime(target_date.year, target_date.month, target_date.day, end_hour, 0, 0, tzinfo=TIMEZONE_OBJ)
     
     start_timestamp = int(start_of_target.timestamp())
     end_timestamp = int(end_of_target.timestamp())
@@ -332,38 +651,130 @@ def export_previous_day_recordings(cameras=None, date=None, time_range=None):
     
     exported_files = []
     
-    for camera in cameras:
-        if should_exit:
-            break
-            
-        try:
-            # 发起导出请求
-            export_data = {
-                "playback": "realtime",
-                "source": "recordings"
-            }
-            
-            # 根据文档，应该是POST请求到这个端点
-            export_url = f"{FRIGATE_API_URL}/api/export/{camera}/start/{start_timestamp}/end/{end_timestamp}"
-            logger.info(f"正在导出摄像头 {camera} 的录像..., export_url: {export_url}")
-            
-            response = requests.post(export_url, json=export_data)
-            if response.status_code in [200, 201]:
-                logger.info(f"已成功发起摄像头 {camera} 的录像导出请求")
+    # 并发发起各摄像头的导出请求，所有请求共享同一个连接池
+    with ThreadPoolExecutor(max_workers=EXPORT_MAX_WORKERS) as executor:
+        futures = [executor.submit(request_export, camera, start_timestamp, end_timestamp) for camera in cameras]
+        for camera, future in zip(cameras, futures):
+            if future.result():
                 # 记录导出开始时间
-                export_start_times[camera] = time.time()
+                set_bounded(export_start_times, camera, time.time())
                 exported_files.append({
                     "camera": camera,
                     "date": start_timestamp
                 })
-            else:
-                logger.error(f"导出摄像头 {camera} 录像失败，状态码: {response.status_code}, 响应: {response.text}")
-                
-        except Exception as e:
-            logger.error(f"导出摄像头 {camera} 录像时出错: {e}")
     
     return exported_files
 
+def set_bounded(records, key, value, max_entries=TRACKING_MAX_ENTRIES):
+    """
+    写入有容量上限的跟踪记录，超出上限时淘汰最早写入的条目
+    
+    Args:
+        records: OrderedDict类型的记录
+        key: 键
+        value: 值
+        max_entries: 最大条目数
+    """
+    records[key] = value
+    records.move_to_end(key)
+    while len(records) > max_entries:
+        records.popitem(last=False)
+
+def detect_same_filesystem():
+    """
+    检测源目录和目标目录是否位于同一文件系统
+    
+    Returns:
+        bool: 是否位于同一文件系统
+    """
+    global SAME_FILESYSTEM
+    
+    try:
+        os.makedirs(DEST_PATH, exist_ok=True)
+        SAME_FILESYSTEM = os.stat(SOURCE_PATH).st_dev == os.stat(DEST_PATH).st_dev
+    except OSError as e:
+        logger.warning(f"无法检测源目录和目标目录所在的文件系统: {e}")
+        SAME_FILESYSTEM = False
+    
+    logger.debug("源目录和目标目录位于同一文件系统: %s", SAME_FILESYSTEM)
+    return SAME_FILESYSTEM
+
+def move_file(src, dst):
+    """
+    移动文件到目标路径
+    
+    同一文件系统内直接重命名（仅修改元数据），否则在内核中复制数据后删除源文件
+    
+    Args:
+        src: 源文件路径
+        dst: 目标文件路径
+    """
+    if SAME_FILESYSTEM:
+        try:
+            os.rename(src, dst)
+            return
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+    
+    if not hasattr(os, 'sendfile'):
+        shutil.move(src, dst)
+        return
+    
+    st = os.stat(src)
+    try:
+        _kernel_copy(src, dst, st.st_size)
+        shutil.copymode(src, dst)
+        os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+    except Exception:
+        # 删除复制了一半的目标文件，保留源文件
+        try:
+            os.unlink(dst)
+        except OSError:
+            pass
+        raise
+    os.unlink(src)
+
+def _kernel_copy(src, dst, size):
+    """
+    在内核中复制文件数据，避免经过用户态缓冲区
+    
+    优先使用copy_file_range（在btrfs/xfs等文件系统上可以直接克隆数据块），
+    不支持时改用sendfile
+    
+    Args:
+        src: 源文件路径
+        dst: 目标文件路径
+        size: 源文件大小
+    """
+    use_copy_file_range = hasattr(os, 'copy_file_range')
+    copied = 0
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        in_fd = fsrc.fileno()
+        out_fd = fdst.fileno()
+        while copied < size:
+            if use_copy_file_range:
+                try:
+                    sent = os.copy_file_range(in_fd, out_fd, COPY_CHUNK_SIZE)
+                except OSError as e:
+                    # 内核或文件系统不支持时，在尚未复制任何数据前改用sendfile
+                    if copied == 0 and e.errno in (errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP):
+                        use_copy_file_range = False
+                        continue
+                    raise
+            else:
+                sent = os.sendfile(out_fd, in_fd, copied, COPY_CHUNK_SIZE)
+            if sent == 0:
+                # 部分文件系统（如FUSE、网络挂载）不支持时copy_file_range直接返回0，改用sendfile
+                if use_copy_file_range and copied == 0:
+                    use_copy_file_range = False
+                    continue
+                break
+            copied += sent
+    
+    if copied != size:
+        raise OSError(f"复制文件 {src} 不完整: {copied}/{size} 字节")
+
 def format_duration(seconds):
     """
     格式化持续时间
@@ -374,9 +785,8 @@ def format_duration(seconds):
     Returns:
         str: 格式化的持续时间
     """
-    hours = int(seconds // 3600)
-    minutes = int((seconds % 3600) // 60)
-    secs = int(seconds % 60)
+    hours, rem = divmod(int(seconds), 3600)
+    minutes, secs = divmod(rem, 60)
     
     if hours > 0:
         return f"{hours}小时{minutes}分钟{secs}秒"
@@ -398,32 +808,117 @@ def get_real_file_path(video_path):
     if not video_path:
         return ""
     
+    return _resolve_real_file_path(SOURCE_PATH, video_path)
+
+@functools.lru_cache(maxsize=1024)
+def _resolve_real_file_path(source_path, video_path):
+    """
+    拼接实际文件路径并缓存结果，轮询期间同一导出文件会被反复转换
+    
+    源目录作为参数传入，以便配置变化时不会命中旧的缓存
+    """
     # 提取文件名
-    filename = os.path.basename(video_path)
+    filename = video_path.rpartition('/')[2]
     # 拼接实际路径
-    real_path = os.path.join(SOURCE_PATH, filename)
-    logger.debug(f"转换路径: {video_path} -> {real_path}")
+    real_path = os.path.join(source_path, filename)
+    logger.debug("转换路径: %s -> %s", video_path, real_path)
     return real_path
 
-def get_file_size(filepath):
+def loads_json(data):
     """
-    获取文件大小并格式化为可读格式
+    解析JSON数据，已安装orjson时使用orjson
     
     Args:
-        filepath: 文件路径
+        data: JSON字节串或字符串
         
     Returns:
-        str: 格式化的文件大小
+        解析后的对象
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def dumps_json_pretty(obj):
+    """
+    将对象格式化为带缩进的JSON字符串，已安装orjson时使用orjson
+    
+    Args:
+        obj: 要格式化的对象
+        
+    Returns:
+        str: 格式化后的JSON字符串
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode()
+    return json.dumps(obj, indent=2)
+
+def _stat_or_none(path):
+    """
+    获取文件状态，文件不存在或无法访问时返回None
+    
+    Args:
+        path: 文件路径
+        
+    Returns:
+        os.stat_result: 文件状态，文件不存在或无法访问时为None
+    """
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+
+def scan_source_dir():
+    """
+    一次读取源目录，建立文件名到目录条目的映射
+    
+    Returns:
+        dict: 文件名 -> os.DirEntry，读取失败时返回None
     """
     try:
-        size = os.path.getsize(filepath)
-        for unit in ['B', 'KB', 'MB', 'GB']:
-            if size < 1024.0:
-                return f"{size:.1f} {unit}"
-            size /= 1024.0
-        return f"{size:.1f} TB"
-    except:
-        return "未知大小"
+        with os.scandir(SOURCE_PATH) as it:
+            return {entry.name: entry for entry in it}
+    except OSError as e:
+        logger.warning(f"无法读取源目录 {SOURCE_PATH}: {e}")
+        return None
+
+def _stat_from_entries(entries, path):
+    """
+    从scan_source_dir的结果中获取文件状态，文件不存在或无法访问时返回None
+    
+    目录条目会缓存stat结果，同一轮检查中重复获取不会再次调用stat；
+    目录读取失败时退回到直接stat
+    
+    Args:
+        entries: scan_source_dir返回的映射
+        path: 文件路径
+        
+    Returns:
+        os.stat_result: 文件状态，文件不存在或无法访问时为None
+    """
+    if entries is None:
+        return _stat_or_none(path)
+    
+    entry = entries.get(os.path.basename(path))
+    if entry is None:
+        return None
+    try:
+        return entry.stat()
+    except OSError:
+        return None
+
+def format_file_size(size):
+    """
+    将字节数格式化为可读格式
+    
+    Args:
+        size: 字节数
+        
+    Returns:
+        str: 格式化的文件大小
+    """
+    # 通过位长度直接确定单位，每级单位相差2^10
+    idx = min(max(size.bit_length() - 1, 0) // 10, len(FILE_SIZE_UNITS) - 1)
+    return f"{size / (1 << (idx * 10)):.1f} {FILE_SIZE_UNITS[idx]}"
 
 def check_export_status(cameras, start_timestamps, max_wait_time=7200, date=None):
     """
@@ -431,8 +926,12 @@ def check_export_status(cameras, start_timestamps, max_wait_time=7200, date=None
     
     Args:
         cameras: 摄像头列表
+        start_timestamps: 导出开始时间戳列表，只检查这些时间段的导出任务
         max_wait_time: 最大等待时间（秒），默认120分钟
         date: 指定日期，格式为 YYYY-MM-DD，如果为None则使用默认天数前的日期
+        
+    Returns:
+        tuple: (是否全部完成, 最后一次获取的导出列表)，未全部完成时导出列表为None
     """
     start_time = time.time()
     logger.info(f"开始检查导出状态，最长等待 {max_wait_time // 60} 分钟...")
@@ -444,38 +943,66 @@ def check_export_status(cameras, start_timestamps, max_wait_time=7200, date=None
             target_date_str = target_date.strftime('%Y-%m-%d')
         except ValueError:
             logger.error(f"日期格式错误: {date}，应为 YYYY-MM-DD 格式")
-            return False
+            return False, None
     else:
         # 使用配置的天数前的日期
         target_date_str = (datetime.now(TIMEZONE_OBJ) - timedelta(days=EXPORT_DAYS_AGO)).strftime('%Y-%m-%d')
     
     # 记录需要等待完成的摄像头
     pending_cameras = set(cameras)
+    timestamps_set = frozenset(start_timestamps)
     
     # 用于跟踪文件大小变化，确保文件写入完成
-    file_sizes = {}
+    file_sizes = OrderedDict()
+    
+    # 自适应轮询：记录上次的导出列表、ETag和状态摘要
+    exports = []
+    last_etag = None
+    last_state_hash = None
+    poll_interval = POLL_INTERVAL_MIN
     
     while time.time() - start_time < max_wait_time and pending_cameras and not should_exit:
+        # 先清除MQTT通知再获取导出列表，检查期间到达的通知会让下一次等待立即返回
+        mqtt_export_event.clear()
         try:
-            # 获取导出列表
-            response = requests.get(f"{FRIGATE_API_URL}/api/exports")
-            response.raise_for_status()
-            exports = response.json()
-            logger.debug(f"当前导出任务: {json.dumps(exports, indent=2)}")
+            # 获取导出列表，内容未变化时服务端返回304，直接复用上次的结果
+            headers = {'If-None-Match': last_etag} if last_etag else {}
+            response = http_session.get(f"{FRIGATE_API_URL}/api/exports", headers=headers, timeout=HTTP_TIMEOUT)
+            if response.status_code != 304:
+                response.raise_for_status()
+                exports = loads_json(response.content)
+                last_etag = response.headers.get('ETag')
+                # 仅在需要输出DEBUG日志时才格式化导出列表
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"当前导出任务: {dumps_json_pretty(exports)}")
+            
+            # 状态未变化时逐步拉长轮询间隔，发生变化时恢复为最短间隔
+            state_hash = hash(tuple(sorted((e.get('id', ''), e.get('in_progress', False)) for e in exports)))
+            if state_hash == last_state_hash:
+                poll_interval = min(poll_interval * POLL_BACKOFF_FACTOR, POLL_INTERVAL_MAX)
+            else:
+                poll_interval = POLL_INTERVAL_MIN
+            last_state_hash = state_hash
+            
+            # 按摄像头建立指定日期导出任务的索引，避免对每个摄像头重复遍历全部导出任务
+            exports_by_camera = defaultdict(list)
+            for e in exports:
+                if e.get("date") in timestamps_set and target_date_str in e.get("name", ""):
+                    exports_by_camera[e.get("camera")].append(e)
+            # 每轮只读取一次源目录，文件是否存在直接从目录列表判断
+            source_entries = scan_source_dir()
             # 初始化进度信息列表
             progress_info = []
             
             # 检查每个待处理的摄像头
             for camera in list(pending_cameras):  # 使用list复制，因为在循环中会修改set
                 # 查找该摄像头相关的指定日期导出任务
-                camera_exports = [e for e in exports 
-                                if e.get("camera") == camera 
-                                and e.get("date") in start_timestamps
-                                and target_date_str in e.get("name", "")]
+                camera_exports = exports_by_camera.get(camera, [])
 
                 # 检查是否还有进行中的任务
                 in_progress_exports = [e for e in camera_exports if e.get("in_progress", False)]
-                logger.debug(f"in_progress_exports: {in_progress_exports}")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("in_progress_exports: %s", in_progress_exports)
                 if not in_progress_exports and camera_exports:
                     # 如果没有进行中的任务且存在相关导出任务，还需要确认文件已完成写入
                     all_files_stable = True
@@ -483,10 +1010,11 @@ def check_export_status(cameras, start_timestamps, max_wait_time=7200, date=None
                         video_path = export.get("video_path", "未知路径")
                         real_path = get_real_file_path(video_path)
                         
-                        if os.path.exists(real_path):
-                            current_size = os.path.getsize(real_path)
+                        st = _stat_from_entries(source_entries, real_path)
+                        if st:
+                            current_size = st.st_size
                             last_size = file_sizes.get(real_path, current_size)
-                            file_sizes[real_path] = current_size
+                            set_bounded(file_sizes, real_path, current_size)
                             
                             # 如果文件大小发生变化，说明还在写入中
                             if current_size != last_size:
@@ -517,12 +1045,13 @@ def check_export_status(cameras, start_timestamps, max_wait_time=7200, date=None
                         elapsed_time = time.time() - export_start_times.get(camera, time.time())
                         elapsed_formatted = format_duration(elapsed_time)
                         
-                        if os.path.exists(real_path):
-                            file_size = get_file_size(real_path)
+                        st = _stat_from_entries(source_entries, real_path)
+                        if st:
+                            file_size = format_file_size(st.st_size)
                             progress_info.append(f"{task_name}({camera}): {file_size}, 已执行: {elapsed_formatted}")
                             
                             # 更新文件大小记录
-                            file_sizes[real_path] = os.path.getsize(real_path)
+                            set_bounded(file_sizes, real_path, st.st_size)
                         else:
                             progress_info.append(f"{task_name}({camera}): 文件不存在, 已执行: {elapsed_formatted}")
             
@@ -533,41 +1062,98 @@ def check_export_status(cameras, start_timestamps, max_wait_time=7200, date=None
                     
             if pending_cameras:
                 logger.info(f"仍有 {len(pending_cameras)} 个摄像头的导出任务未完成: {', '.join(pending_cameras)}")
-                logger.info("继续等待导出任务完成...")
-                time.sleep(30)  # 等待30秒再检查
+                logger.info(f"继续等待导出任务完成，{poll_interval:.0f}秒后再次检查...")
+                wait_for_next_poll(poll_interval)
             else:
                 logger.info("所有摄像头的导出任务已完成")
-                return True
+                return True, exports
                 
         except Exception as e:
             logger.error(f"检查导出状态时出错: {e}")
-            time.sleep(30)
+            wait_for_next_poll(30)
     
     if pending_cameras:
         logger.warning(f"等待导出完成超时，以下摄像头任务未完成: {', '.join(pending_cameras)}")
-    else:
-        logger.info("所有导出任务已完成")
+        return False, None
     
-    return not bool(pending_cameras)
+    logger.info("所有导出任务已完成")
+    return True, exports
+
+def move_exported_file(export):
+    """
+    将单个已完成的导出文件移动到目标目录，并删除Frigate中的导出记录
+
+    Args:
+        export: 导出任务信息
+
+    Returns:
+        bool: 是否成功移动文件
+    """
+    if should_exit:
+        return False
+
+    # 获取导出文件路径
+    video_path = export.get("video_path", "")
+    # 转换为实际文件路径
+    real_path = get_real_file_path(video_path)
+
+    st = _stat_or_none(real_path) if video_path else None
+    if not st:
+        logger.warning(f"导出文件不存在或路径无效: {real_path}")
+        return False
+
+    # 显示文件信息
+    file_size = format_file_size(st.st_size)
+    camera = export.get("camera", "Unknown")
+    elapsed_time = time.time() - export_start_times.get(camera, time.time())
+    elapsed_formatted = format_duration(elapsed_time)
+    logger.info(f"处理文件: {real_path} (大小: {file_size}, 总耗时: {elapsed_formatted})")
+
+    # 构造目标文件路径
+    filename = os.path.basename(real_path)
+    dest_file = os.path.join(DEST_PATH, filename)
+
+    # 移动文件到目标目录
+    try:
+        move_file(real_path, dest_file)
+        logger.info(f"已将 {filename} 移动到 {DEST_PATH}")
+    except Exception as e:
+        logger.error(f"移动文件 {filename} 时出错: {e}")
+        return False
 
-def check_and_move_exported_files(cameras, start_timestamps, date=None):
+    # 可选：删除Frigate中的导出记录
+    export_id = export.get("id", "")
+    if export_id:
+        try:
+            delete_response = http_session.delete(f"{FRIGATE_API_URL}/api/export/{export_id}", timeout=HTTP_TIMEOUT)
+            if delete_response.status_code in [200, 204]:
+                logger.info(f"已从Frigate中删除导出记录: {export_id}")
+        except Exception as e:
+            logger.error(f"删除导出记录 {export_id} 时出错: {e}")
+
+    return True
+
+def check_and_move_exported_files(cameras, start_timestamps, date=None, prefetched_exports=None):
     """
     检查已完成的导出文件并将其移动到目标目录
 
     Args:
         cameras: 摄像头列表
         date: 指定日期，格式为 YYYY-MM-DD，如果为None则使用默认天数前的日期
+        prefetched_exports: 已获取的导出列表（如check_export_status的结果），为None时重新获取
     """
     try:
-        # 获取导出列表
-        response = requests.get(f"{FRIGATE_API_URL}/api/exports")
-        response.raise_for_status()
-        exports = response.json()
+        if prefetched_exports is not None:
+            exports = prefetched_exports
+        else:
+            # 获取导出列表
+            response = http_session.get(f"{FRIGATE_API_URL}/api/exports", timeout=HTTP_TIMEOUT)
+            response.raise_for_status()
+            exports = loads_json(response.content)
 
         # 创建目标目录（如果不存在）
         os.makedirs(DEST_PATH, exist_ok=True)
 
-        moved_files = 0
         # 获取目标日期
         if date:
             try:
@@ -580,57 +1166,21 @@ def check_and_move_exported_files(cameras, start_timestamps, date=None):
             # 使用配置的天数前的日期
             target_date_str = (datetime.now(TIMEZONE_OBJ) - timedelta(days=EXPORT_DAYS_AGO)).strftime('%Y-%m-%d')
 
-        # 只处理指定摄像头和日期的导出任务
-        target_exports = [e for e in exports 
-                         if e.get("camera") in cameras 
-                         and e.get("date") in start_timestamps
+        # 只处理指定摄像头和日期的导出任务，使用集合做O(1)成员判断，单次遍历完成筛选
+        cameras_set = frozenset(cameras)
+        timestamps_set = frozenset(start_timestamps)
+        target_exports = [e for e in exports
+                         if (name := e.get("name", ""))
+                         and target_date_str in name
                          and not e.get("in_progress", False)
-                         and target_date_str in e.get("name", "")]
+                         and e.get("camera") in cameras_set
+                         and e.get("date") in timestamps_set]
         
         logger.info(f"找到 {len(target_exports)} 个 {target_date_str} 已完成的导出任务")
 
-        for export in target_exports:
-            if should_exit:
-                break
-
-            # 获取导出文件路径
-            video_path = export.get("video_path", "")
-            # 转换为实际文件路径
-            real_path = get_real_file_path(video_path)
-
-            if not video_path or not os.path.exists(real_path):
-                logger.warning(f"导出文件不存在或路径无效: {real_path}")
-                continue
-
-            # 显示文件信息
-            file_size = get_file_size(real_path)
-            camera = export.get("camera", "Unknown")
-            elapsed_time = time.time() - export_start_times.get(camera, time.time())
-            elapsed_formatted = format_duration(elapsed_time)
-            logger.info(f"处理文件: {real_path} (大小: {file_size}, 总耗时: {elapsed_formatted})")
-
-            # 构造目标文件路径
-            filename = os.path.basename(real_path)
-            dest_file = os.path.join(DEST_PATH, filename)
-
-            # 移动文件到目标目录
-            try:
-                shutil.move(real_path, dest_file)
-                logger.info(f"已将 {filename} 移动到 {DEST_PATH}")
-                moved_files += 1
-
-                # 可选：删除Frigate中的导出记录
-                export_id = export.get("id", "")
-                if export_id:
-                    try:
-                        delete_response = requests.delete(f"{FRIGATE_API_URL}/api/export/{export_id}")
-                        if delete_response.status_code in [200, 204]:
-                            logger.info(f"已从Frigate中删除导出记录: {export_id}")
-                    except Exception as e:
-                        logger.error(f"删除导出记录 {export_id} 时出错: {e}")
-
-            except Exception as e:
-                logger.error(f"移动文件 {filename} 时出错: {e}")
+        # 并发移动文件并删除导出记录，磁盘I/O和HTTP请求都会释放GIL
+        with ThreadPoolExecutor(max_workers=MOVE_MAX_WORKERS) as executor:
+            moved_files = sum(executor.map(move_exported_file, target_exports))
 
         logger.info(f"共移动了 {moved_files} 个文件")
 
@@ -645,6 +1195,8 @@ def clean_old_exports():
         # 获取中国时区的当前时间
         now_china = datetime.now(TIMEZONE_OBJ)
         cutoff_date = now_china - timedelta(days=EXPORT_RETENTION_DAYS)
+        # 转换为时间戳，直接与文件修改时间比较，无需为每个文件构造datetime对象
+        cutoff_epoch = cutoff_date.timestamp()
         logger.info(f"清理 {cutoff_date.strftime('%Y-%m-%d')} 之前的历史文件")
         
         if not os.path.exists(DEST_PATH):
@@ -652,27 +1204,23 @@ def clean_old_exports():
             return
 
         cleaned_files = 0
-        for filename in os.listdir(DEST_PATH):
+        # scandir在遍历目录时即可获得文件类型，避免对每个条目重复调用stat
+        with os.scandir(DEST_PATH) as it:
+            entries = [entry for entry in it if entry.is_file(follow_symlinks=False)]
+
+        for entry in entries:
             if should_exit:
                 break
 
-            file_path = os.path.join(DEST_PATH, filename)
-            if os.path.isfile(file_path):
-                # 根据文件修改时间判断
-                file_modified = datetime.fromtimestamp(os.path.getmtime(file_path))
-                # 确保比较的是相同类型的datetime对象
-                if file_modified.tzinfo is None:
-                    file_modified = TIMEZONE_OBJ.localize(file_modified)
-                else:
-                    file_modified = file_modified.astimezone(TIMEZONE_OBJ)
-
-                if file_modified < cutoff_date:
-                    try:
-                        os.remove(file_path)
-                        logger.info(f"已删除过期文件: {filename}")
-                        cleaned_files += 1
-                    except Exception as e:
-                        logger.error(f"删除文件 {filename} 时出错: {e}")
+            filename = entry.name
+            # 根据文件修改时间判断
+            if entry.stat(follow_symlinks=False).st_mtime < cutoff_epoch:
+                try:
+                    os.remove(entry.path)
+                    logger.info(f"已删除过期文件: {filename}")
+                    cleaned_files += 1
+                except Exception as e:
+                    logger.error(f"删除文件 {filename} 时出错: {e}")
 
         logger.info(f"共清理了 {cleaned_files} 个过期文件")
 
@@ -680,4 +1228,7 @@ def clean_old_exports():
         logger.error(f"清理旧导出文件时出错: {e}")
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:
+        stop_mqtt_listener()